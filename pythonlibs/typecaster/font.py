@@ -52,6 +52,9 @@ def getOpener(fontPath: Path, openerKey=None):
 
 FontCache = {}
 
+# Maximum number of glyph outlines kept in a font's outline_cache before it is cleared
+OUTLINE_CACHE_SIZE = 4096
+
 # def clear_cache():
 #     FontCache.clear()
 
@@ -92,6 +95,11 @@ class Font:
         self._instances = None
         self._instances_scaled = None
 
+        # Control points of previously drawn glyphs, used by Typecaster's core to avoid redrawing them every cook.
+        # These are grouped by the variations and overlap removal they were drawn with, and then keyed by glyph id.
+        self.outline_cache = {}
+        self.outline_count = 0
+
         self.best_line_spacing = self.get_best_line_spacing()
         self.bezier_order = self.get_bezier_order()
 
@@ -6,12 +6,17 @@ This is intended for use with the outlines of a font's glyphs.
 """
 
 
+from __future__ import annotations
 import hou
 try:
     from pathops import PathVerb
 except ImportError:
     PathVerb = None
     pass
+try:
+    import uharfbuzz as hb
+except ImportError:
+    hb = None
 
 
 __CTRLPTS_ATTRIBNAME__ = "ctrlpts"
@@ -22,7 +27,10 @@ class HoudiniBasePen():
     This class should not be directly instantiated, and instead either HoudiniCubicPen or HoudiniQuadraticPen should be used.
     """
     bezier_order = None
-    def __init__(self, geo:hou.Geometry, attrib_ctrlpts:hou.Attrib=None, polygon:hou.Polygon=None):
+    # Reusable uharfbuzz draw functions for this type of pen, set at the bottom of this module if available
+    _drawfuncs = None
+
+    def __init__(self, geo:hou.Geometry, attrib_ctrlpts:hou.Attrib=None):
         """
         Initialize a Houdini Pen.
 
@@ -34,17 +42,14 @@ class HoudiniBasePen():
             attrib_ctrlpts (hou.Attrib):
                 Attribute which should be used for writing the control point information. If not specified,
                 an attribute will be created.
-            polygon (hou.Polygon):
-                The polygon which the new point will be connected to. This is often specified after
-                the initial creation of the Pen object. Ignored if not specified. 
 
         """
         if type(self) is HoudiniBasePen:
             raise Exception("<HoudiniBasePen> must be subclassed.")
         
         self.ptsset = []
+        self.paths = []
         self.geo = geo
-        self.polygon = polygon
 
         if not attrib_ctrlpts:
             self.attrib_ctrlpts:hou.Attrib = geo.findPointAttrib(__CTRLPTS_ATTRIBNAME__)
@@ -54,13 +59,16 @@ class HoudiniBasePen():
             self.attrib_ctrlpts = attrib_ctrlpts
 
     def closePath(self):
-        "Create a new point in Houdini for the current array of control points, and then clear the list."
-        pt = self.geo.createPoint()
-        if self.polygon:
-            self.polygon.addVertex(pt)
-        pt.setAttribValue( self.attrib_ctrlpts, self.ptsset)
+        "Store the current array of control points to be retrieved with popPaths, and then clear the list."
+        self.paths.append(self.ptsset)
         self.ptsset = []
 
+    def popPaths(self) -> list[list[float]]:
+        "Get the control point arrays of every path closed since the last call, and then clear them from the pen."
+        paths = self.paths
+        self.paths = []
+        return paths
+
     def endPath(self):
         raise NotImplementedError("Unsupported move of endPath called. This should not happen in regular usage.")
     
@@ -70,6 +78,24 @@ class HoudiniBasePen():
     def curveTo(self, *args):
         raise NotImplementedError("Unsupported move of curveTo called. Are you using the right curve type?")
     
+    def drawGlyph(self, font, gid:int):
+        """
+        Draw a glyph from a uharfbuzz font with this pen.
+
+        Unlike font.draw_glyph_with_pen, which creates new draw functions that call the pen's methods for
+        every glyph, this reuses a single set of draw functions which write the control points directly.
+
+        Args:
+            font (uharfbuzz.Font):
+                Font to draw the glyph from.
+            gid (int):
+                The id of the glyph to draw.
+        """
+        if self._drawfuncs is not None:
+            font.draw_glyph(gid, self._drawfuncs, self)
+        else:
+            font.draw_glyph_with_pen(gid, self)
+
     def output_from_pathops_path(self, path):
         """
         Call the needed operations to write a pathops path, iterating though each move and set of points.
@@ -137,6 +163,41 @@ class HoudiniCubicPen(HoudiniBasePen):
         # converting from quadratic to cubic.
 
 
+def __make_drawfuncs(move_to, line_to, quadratic_to, cubic_to) -> hb.DrawFuncs:
+    "Create a set of uharfbuzz draw functions, using the pen passed as the draw data."
+    def close_path(pen):
+        pen.paths.append(pen.ptsset)
+        pen.ptsset = []
+    drawfuncs = hb.DrawFuncs()
+    drawfuncs.set_move_to_func(move_to)
+    drawfuncs.set_line_to_func(line_to)
+    drawfuncs.set_quadratic_to_func(quadratic_to)
+    drawfuncs.set_cubic_to_func(cubic_to)
+    drawfuncs.set_close_path_func(close_path)
+    return drawfuncs
+
+# Older versions of uharfbuzz can only draw with a pen, so drawGlyph falls back to draw_glyph_with_pen for those.
+# Moves which a pen doesn't support still go through its methods, so they raise the same errors.
+if hb is not None and hasattr(hb.Font, "draw_glyph"):
+    def __quadratic_point(x, y, pen):
+        pen.ptsset.extend( (x, y, x, y) )
+    def __cubic_point(x, y, pen):
+        pen.ptsset.extend( (x, y, x, y, x, y) )
+
+    HoudiniQuadraticPen._drawfuncs = __make_drawfuncs(
+        move_to=__quadratic_point,
+        line_to=__quadratic_point,
+        quadratic_to=lambda x1, y1, x2, y2, pen: pen.ptsset.extend( (x1, y1, x2, y2) ),
+        cubic_to=lambda x1, y1, x2, y2, x3, y3, pen: pen.curveTo( (x1, y1), (x2, y2), (x3, y3) ),
+    )
+    HoudiniCubicPen._drawfuncs = __make_drawfuncs(
+        move_to=__cubic_point,
+        line_to=__cubic_point,
+        quadratic_to=lambda x1, y1, x2, y2, pen: pen.ptsset.extend( (x1, y1, x2, y2, x2, y2) ),
+        cubic_to=lambda x1, y1, x2, y2, x3, y3, pen: pen.ptsset.extend( (x1, y1, x2, y2, x3, y3) ),
+    )
+
+
 def getHoudiniPen( bezier_order:int, *args, **kwargs):
     """
     Factory function for creating an appropriate HoudiniPen based off of the bezier order
@@ -149,9 +210,6 @@ def getHoudiniPen( bezier_order:int, *args, **kwargs):
         attrib_ctrlpts (hou.Attrib):
             Attribute which should be used for writing the control point information. If not specified,
             an attribute will be created.
-        polygon (hou.Polygon):
-            The polygon which the new point will be connected to. This is often specified after
-            the initial creation of the Pen object. Ignored if not specified. 
     """
     if bezier_order == 3:
         return HoudiniQuadraticPen( *args, **kwargs)
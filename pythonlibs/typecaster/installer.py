@@ -12,111 +12,522 @@ import sys
 from pathlib import Path
 from typecaster import config
 from platform import system as get_platform_system
+import collections
 import contextlib
 import ssl
-import json
 import re
-import shutil
-import hashlib
-try:
-	from urllib.request import urlopen
-	from urllib.request import Request
-except ModuleNotFoundError or ImportError:
-	from urllib2 import urlopen # type: ignore
-	from urllib2.request import Request # type: ignore
+import threading
+import time
+# json, shutil, hashlib, tempfile, concurrent.futures, and requests are imported within the functions
+# which use them, so that simple operations (like checking an install) don't pay for them at import.
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
 
 
 # No point in working with the installer if $TYPECASTER doesn't exist.
-if not os.getenv('TYPECASTER') or not Path( os.getenv('TYPECASTER') ).exists():
+# A strict resolve checks that the path exists while resolving it, rather than hitting the filesystem twice.
+try:
+    if not os.getenv('TYPECASTER'):
+        raise FileNotFoundError
+    TYPECASTER_ROOT_PATH = Path( os.getenv('TYPECASTER') ).resolve(strict=True)
+except OSError:
     raise Exception("Could not find the TYPECASTER environment variable or the path it's referencing doesn't exist!")
-
-TYPECASTER_ROOT_PATH = Path( os.getenv('TYPECASTER') ).resolve()
 TYPECASTER_URL = 'https://api.github.com/repos/toby5001/Typecaster-For-Houdini'
-REQUIREMENTS_PATH = ( TYPECASTER_ROOT_PATH / "requirements.txt" ).resolve()
+# Everything else is derived from the root path, which is already resolved.
+REQUIREMENTS_PATH = TYPECASTER_ROOT_PATH / "requirements.txt"
 PYTHON_VERSION = f"{str(sys.version_info.major)}.{str(sys.version_info.minor)}"
 PYTHON_INSTALLFOLDERNAME = f"python{PYTHON_VERSION}libs"
-TYPECASTER_PYTHON_INSTALL_PATH = (TYPECASTER_ROOT_PATH / PYTHON_INSTALLFOLDERNAME).resolve()
-HMAJOR = int(os.getenv("HOUDINI_MAJOR_RELEASE"))
-HMINOR = int(os.getenv("HOUDINI_MINOR_RELEASE"))
+TYPECASTER_PYTHON_INSTALL_PATH = TYPECASTER_ROOT_PATH / PYTHON_INSTALLFOLDERNAME
+# Written into each pythonX.XXlibs folder after a successful install, so that pip isn't run again until requirements.txt changes.
+REQUIREMENTS_STAMP_NAME = ".reqs.sha256"
+# These are only set within a Houdini environment. Treating them as unknown (None) rather than failing
+# keeps the pure helpers (like get_update_cmd) importable from anywhere $TYPECASTER is set.
+# Anything gated on the Houdini version is skipped when it's unknown.
+HMAJOR = int(os.environ["HOUDINI_MAJOR_RELEASE"]) if os.getenv("HOUDINI_MAJOR_RELEASE") else None
+HMINOR = int(os.environ["HOUDINI_MINOR_RELEASE"]) if os.getenv("HOUDINI_MINOR_RELEASE") else None
 PLATFORM = get_platform_system().upper()
+# Used when building commands, which is done from the UI and shouldn't need to convert the path each time.
+_TYPECASTER_ROOT_POSIX = TYPECASTER_ROOT_PATH.as_posix()
+# Update modes and their aliases, with the first item of each being the mode name update() expects.
+# The order of these is also used for the update method selection in the standalone GUI.
+MODEOPTIONS = (('latest_stable_release','ls'), ('latest_commit','lc'), ('latest_release','lr'), ('release_tag','release','r'))
+# Maps each of the above aliases (and the mode name itself) to the mode name
+_MODE_LOOKUP = {alias: options[0] for options in MODEOPTIONS for alias in options}
+# How long (in seconds) the github releases json is reused, both within a process and on disk between processes.
+RELEASES_CACHE_TTL = 60
+RELEASES_DISKCACHE_TTL = 600
+
+# The modules which check_install imports to confirm Typecaster's dependencies are working
+_REQUIRED_MODULES = ("typecaster.font", "typecaster.fontFinder", "typecaster.bidi_segmentation")
+
+# Matches the names of the per-python-version dependency folders, like python3.11libs
+_PYLIB_RE = re.compile(r"^python\d\.\d{1,2}libs$")
+
+# Arguments for the single git fetch used to update from origin
+_FETCH_ARGS = ("fetch", "--prune", "--tags", "--force", "origin")
+
+# How long (in seconds) a downloaded get-pip.py is reused without checking if it has changed
+GETPIP_MAX_AGE = 7 * 86400
+# Size of each chunk written to disk when downloading files
+DOWNLOAD_CHUNKSIZE = 1 << 16
+# How many lines of a streamed command's output are kept to be returned. Everything is printed as it arrives,
+# so only the tail (where any errors will be) is worth holding onto.
+STREAM_TAIL_LINES = 200
+# How long (in seconds) a HythonSession command can go without any output before hython is considered hung and is killed.
+# pip prints regularly while it works, so this is only reached if something is genuinely stuck.
+HYTHON_IDLE_TIMEOUT = 600
+
+# Background commands are only read by the installer, so on Windows they don't need a console window attached.
+_NO_WINDOW_FLAGS = getattr(subprocess, "CREATE_NO_WINDOW", 0) if PLATFORM == "WINDOWS" else 0
+# git is only ever run to be read by the installer, so it doesn't need the user's locale catalogs or a pager.
+_GIT_ENV = dict(os.environ, LC_ALL="C", GIT_PAGER="cat", PAGER="cat")
+
+_releases_cache = None
+# A single pooled session is reused for every request so that connections can be kept alive between them.
+# This is created on first use by __get_session__, and is False if requests isn't available.
+_SESSION = None
+
+
+def __runcmd__(cmd:list[str], do_print=True, stream=False, env:dict=None):
+    """Run a command from the Typecaster root folder.
 
+    Args:
+        cmd (list[str]): The command to run, as a list of arguments.
+        do_print (bool, optional): Print the error if the command fails. Defaults to True.
+        stream (bool, optional): Print the output line by line as the command runs, rather than
+            buffering it until it finishes. Useful for long-running commands like pip. When enabled,
+            stderr is merged into stdout, and only the last STREAM_TAIL_LINES lines are returned (as both).
+            Defaults to False.
+        env (dict, optional): The environment to run the command with. The current one is used if not specified.
 
-def __runcmd__(cmd, do_print=True):
+    Returns:
+        tuple[bool, bytes, bytes]: If the command was successful, along with it's stdout and stderr.
+    """
     # print(cmd)
     # return False, bytes(), bytes()
-    process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=TYPECASTER_ROOT_PATH)
-    stdout, stderr = process.communicate()
+    try:
+        process = subprocess.Popen(cmd, shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT if stream else subprocess.PIPE, cwd=TYPECASTER_ROOT_PATH, env=env, creationflags=_NO_WINDOW_FLAGS)
+    except OSError as e:
+        # Without a shell, a missing executable raises instead of returning a failed exit code.
+        if do_print:
+            print(f'Running command "{" ".join(cmd)}" failed with the following error:')
+            print(e)
+        return False, bytes(), str(e).encode()
+    if stream:
+        stdout_tail = collections.deque(maxlen=STREAM_TAIL_LINES)
+        for line in process.stdout:
+            # print (rather than writing to sys.stdout) so the output also shows up in the GUI's log
+            print(line.decode(errors='replace').rstrip())
+            stdout_tail.append(line)
+        process.wait()
+        stdout = stderr = b"".join(stdout_tail)
+    else:
+        stdout, stderr = process.communicate()
 
     if process.returncode == 0:
         return True, stdout, stderr
     else:
         if do_print:
-            print(f'Running command "{cmd}" failed with the following error:')
-            print(stderr.decode())
+            if stream:
+                # The output has already been printed
+                print(f'Running command "{" ".join(cmd)}" failed with exit code {process.returncode}')
+            else:
+                print(f'Running command "{" ".join(cmd)}" failed with the following error:')
+                print(stderr.decode())
         return False, stdout, stderr
 
 
-def __get_filehash__(file:Path):
-    fhash = None
-    if file.exists():
-        with file.open('rb') as f:
-            hashfunc = hashlib.new('sha256')
-            hashfunc.update(f.read())
-            fhash = hashfunc.hexdigest()
-    return fhash
+def __rungit__(*args:str, do_print=True):
+    """Run git with the given arguments in the Typecaster repo."""
+    return __runcmd__(["git", "--no-pager", *args], do_print=do_print, env=_GIT_ENV)
+
+
+# Source for the persistent hython process used by HythonSession. Each line received on stdin is
+# a json-encoded string of python source, which is executed before the sentinel line is written
+# along with the exit code and anything written to stderr.
+_HYTHON_SERVER_SRC = """
+import sys, io, json, traceback
+for _line in sys.stdin:
+    _code = 0
+    _stderr = sys.stderr
+    sys.stderr = io.StringIO()
+    try:
+        exec(json.loads(_line), {'__name__': '__main__'})
+    except SystemExit as e:
+        _code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        _code = 1
+    _err = sys.stderr.getvalue()
+    sys.stderr = _stderr
+    sys.stdout.flush()
+    print('<<<DONE>>>' + json.dumps([_code, _err]), flush=True)
+"""
+
+
+# Runs get-pip.py in a HythonSession. get-pip imports pip from a temporary zip which it deletes afterwards,
+# so that copy of pip is purged from the session (along with the zip's sys.path entry). Otherwise run_pip
+# would reuse those stale modules, and pip's lazily imported commands would fail to load from the missing zip.
+_GETPIP_SRC = """
+import sys, runpy
+_path = list(sys.path)
+try:
+    runpy.run_path({path!r}, run_name='__main__')
+finally:
+    sys.path[:] = _path
+    for _name in [_name for _name in sys.modules if _name == 'pip' or _name.startswith('pip.')]:
+        del sys.modules[_name]
+"""
+
+
+class HythonSession():
+    """
+    A single long-running hython process which python source can be sent to. Since starting hython
+    is quite slow, this allows for a sequence of commands (like installing pip and then running it)
+    to only pay that cost once.
+    """
+    SENTINEL = "<<<DONE>>>"
+
+    def __init__(self):
+        self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def run(self, py_source:str, stream=False):
+        """Run python source in the hython process.
+
+        Args:
+            py_source (str): The python source to run.
+            stream (bool, optional): Print the output line by line as it is received. Only the last
+                STREAM_TAIL_LINES lines are returned when enabled. Defaults to False.
+
+        Returns:
+            tuple[bool, bytes, bytes]: The same success, stdout, and stderr result as __runcmd__.
+        """
+        import json
+        if self.process is None:
+            try:
+                self.process = subprocess.Popen(["hython", "-u", "-c", _HYTHON_SERVER_SRC], stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=TYPECASTER_ROOT_PATH, text=True, creationflags=_NO_WINDOW_FLAGS)
+            except OSError as e:
+                return False, bytes(), str(e).encode()
+        try:
+            self.process.stdin.write(json.dumps(py_source) + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            self.close()
+            return False, bytes(), str(e).encode()
+        stdout = collections.deque(maxlen=STREAM_TAIL_LINES) if stream else []
+        # Kills hython if it stops producing output, which ends the loop below rather than blocking on it forever.
+        # This only kills the process, since printing from the timer's thread isn't safe with the standalone GUI.
+        def arm_watchdog():
+            timer = threading.Timer(HYTHON_IDLE_TIMEOUT, self.process.kill)
+            timer.daemon = True
+            timer.start()
+            return timer
+        watchdog = arm_watchdog()
+        try:
+            for line in self.process.stdout:
+                watchdog.cancel()
+                watchdog = arm_watchdog()
+                # The sentinel directly follows whatever the code wrote, so it isn't at the start of the line
+                # if that output didn't end with a newline.
+                idx = line.find(self.SENTINEL)
+                if idx >= 0:
+                    output, line = line[:idx], line[idx:]
+                    if output:
+                        if stream:
+                            print(output)
+                        stdout.append(output)
+                    code, stderr = json.loads(line[len(self.SENTINEL):])
+                    return code == 0, "".join(stdout).encode(), stderr.encode()
+                if stream:
+                    print(line.rstrip())
+                stdout.append(line)
+        finally:
+            watchdog.cancel()
+        # The process exited (or was killed for going quiet) before the sentinel was written
+        self.close()
+        return False, "".join(stdout).encode(), b"hython exited unexpectedly or stopped responding"
+
+    def run_pip(self, *args:str, stream=False):
+        """Run pip with the given arguments, equivalent to running "hython -m pip <args>"."""
+        argv = ["pip", *args]
+        return self.run(f"import sys, runpy, importlib; importlib.invalidate_caches(); sys.argv = {argv!r}; runpy.run_module('pip', run_name='__main__', alter_sys=True)", stream=stream)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process.wait()
+            self.process = None
+
+
+def __get_session__():
+    """Get the pooled requests session, creating it if needed.
+
+    Returns:
+        requests.Session: The session, or None if requests isn't available.
+    """
+    global _SESSION
+    if _SESSION is None:
+        try:
+            import requests
+            _SESSION = requests.Session()
+        except ImportError:
+            _SESSION = False
+    return _SESSION if _SESSION else None
+
+
+def __download__(url:str, filepath:Path, if_modified=False):
+    """Stream the contents of url directly into filepath, one chunk at a time.
+
+    Args:
+        url (str): The url to download.
+        filepath (Path): Where to write the download.
+        if_modified (bool, optional): If filepath already exists, only download url if it has been
+            modified since filepath was written. Defaults to False.
+
+    Returns:
+        bool: True if filepath was written, or False if the existing file was already up to date.
+
+    Raises:
+        OSError: Raised if the download fails, including HTTP error statuses.
+    """
+    import shutil
+    from email.utils import formatdate
+    headers = {}
+    if if_modified and filepath.exists():
+        headers["If-Modified-Since"] = formatdate(filepath.stat().st_mtime, usegmt=True)
+    # Written alongside and then moved into place, so an interrupted download never looks up to date.
+    partpath = filepath.with_name(filepath.name + ".part")
+    try:
+        session = __get_session__()
+        if session is not None:
+            with session.get(url, headers=headers, stream=True, timeout=30) as r:
+                if r.status_code == 304:
+                    return False
+                r.raise_for_status()
+                r.raw.decode_content = True
+                with partpath.open('wb') as f:
+                    shutil.copyfileobj(r.raw, f, length=DOWNLOAD_CHUNKSIZE)
+        else:
+            try:
+                # urlopen raises HTTPError (an OSError) for error statuses, so only the body needs to be handled here
+                with contextlib.closing(urlopen(Request(url, headers=headers), context=ssl._create_unverified_context(), timeout=30)) as r, partpath.open('wb') as f:
+                    shutil.copyfileobj(r, f, length=DOWNLOAD_CHUNKSIZE)
+            except HTTPError as e:
+                if e.code == 304:
+                    return False
+                raise
+        os.replace(partpath, filepath)
+    finally:
+        if partpath.exists():
+            partpath.unlink()
+    return True
+
+
+def __pip_install_args__(installpath:Path) -> list[str]:
+    """Get the arguments for pip to install Typecaster's dependencies into installpath."""
+    # .pyc files are skipped since python will write them anyway on first import
+    return ["install", "--target", str(installpath), "-r", str(REQUIREMENTS_PATH), "--upgrade", "--no-compile"]
+
+
+def __prepend_sys_path__(path:Path, require_first=False):
+    """Insert path at the start of sys.path if it isn't already in it.
+
+    sys.path holds strings, so entries are compared as (case-normalized) strings rather than against the Path itself.
+
+    Args:
+        path (Path): The path to add.
+        require_first (bool, optional): Only consider the path already added if it's the first entry,
+            since it needs to take priority over everything else. Defaults to False.
+
+    Returns:
+        bool: True if sys.path was modified.
+    """
+    target = os.path.normcase(str(path))
+    entries = sys.path[:1] if require_first else sys.path
+    if any(os.path.normcase(entry) == target for entry in entries):
+        return False
+    sys.path.insert(0, str(path))
+    return True
+
+
+def __requirements_stamp__(py_version:str):
+    """Get a hash of requirements.txt along with the python version it's being installed for."""
+    import hashlib
+    hashfunc = hashlib.new('sha256')
+    hashfunc.update(REQUIREMENTS_PATH.read_bytes())
+    hashfunc.update(py_version.encode())
+    return hashfunc.hexdigest()
 
 
-def install_dependencies():
+def __install_is_current__(installpath:Path, py_version:str):
+    """Check if installpath was last successfully installed to from the current requirements.txt.
+
+    Returns:
+        tuple[bool, str]: If the install is current, along with the stamp to write after installing.
+    """
+    stamp = __requirements_stamp__(py_version)
+    try:
+        return (installpath / REQUIREMENTS_STAMP_NAME).read_text().strip() == stamp, stamp
+    except OSError:
+        return False, stamp
+
+
+def __uv_install__(installpath:Path, python:str):
+    """Install Typecaster's dependencies into installpath with uv, which downloads and installs packages in parallel.
+
+    Args:
+        installpath (Path): The folder to install the dependencies into.
+        python (str): The python (or hython) executable to install for, either as a path or a name to find on PATH.
+
+    Returns:
+        tuple[bool, bytes, bytes] | None: The same result as __runcmd__, or None if uv or the python executable can't
+            be found, uv is disabled in the config, or it fails (in which case pip should be used instead).
+    """
+    import shutil
+    uv = shutil.which("uv")
+    if not uv or not config.get_config().get("prefer_uv", 1):
+        return None
+    python = shutil.which(python)
+    if not python:
+        return None
+    cmd = [uv, "pip", "install", "--target", str(installpath), "-r", str(REQUIREMENTS_PATH), "--upgrade", "--python", python]
+    # uv is quick enough that its output isn't streamed. This keeps a failure from showing up in the log as an install error,
+    # when pip is about to be tried instead.
+    result = __runcmd__(cmd, do_print=False)
+    if not result[0]:
+        reason = result[2].decode(errors='replace').strip().splitlines()
+        print(f"Installing with uv failed{f' ({reason[-1]})' if reason else ''}. Falling back to pip.")
+        return None
+    # uv reports what it installed on stderr
+    print(result[2].decode(errors='replace').rstrip())
+    return result
+
+
+def install_dependencies(force=False):
     """Install Typecaster's dependencies that are not included with the main distribution.
 
     Args:
-        verbose (bool, optional): If enabled, the full stdout of running pip will be printed. Defaults to False.
+        force (bool, optional): Run pip even if the dependencies were already installed from the current requirements.txt. Defaults to False.
 
     Returns:
         bool: Returns True if Typecaster could be installed. Otherwise False.
     """    
-
-    if HMAJOR < 19 or ( HMAJOR == 19 and HMINOR < 5 ):
-        # If this is true, Houdini is below the version number where pip is included in it's python instalation. Additional checks will be run.
-        print( f"pip not installed by default in this version of Houdini ({HMAJOR}.{HMINOR})! Checking for an existing installation.")
-        pipstatus = check_install_pip()
-        if not pipstatus:
-            raise Exception("pip could not be found or installed. Typecaster install process terminated.")
-            return False
+    current, stamp = __install_is_current__(TYPECASTER_PYTHON_INSTALL_PATH, PYTHON_VERSION)
+    if current and not force:
+        print(f"Typecaster dependencies for python {PYTHON_VERSION} are already installed from the current {REQUIREMENTS_PATH.name}.")
+        __prepend_sys_path__(TYPECASTER_PYTHON_INSTALL_PATH)
+        return True
 
     # If it doesn't already exist, create the folder which all of the packages will be installed into
-    TYPECASTER_PYTHON_INSTALL_PATH.mkdir(exist_ok=True)
+    if not TYPECASTER_PYTHON_INSTALL_PATH.is_dir():
+        TYPECASTER_PYTHON_INSTALL_PATH.mkdir(parents=True, exist_ok=True)
 
     print(f"Installing Typecaster dependencies for python {PYTHON_VERSION}...")
-    cmd = f"""hython -m pip install --target "{TYPECASTER_PYTHON_INSTALL_PATH}" -r {REQUIREMENTS_PATH} --upgrade"""
-    success, stdout, stderr = __runcmd__(cmd, do_print=False)
+    # Within a Houdini session sys.executable is houdini itself rather than a python interpreter, so hython is used like it is for pip
+    result = __uv_install__(TYPECASTER_PYTHON_INSTALL_PATH, "hython")
+    if result is not None:
+        success, stdout, stderr = result
+    else:
+        # Checking for pip, installing it, and running it all happen in the same hython process
+        with HythonSession() as session:
+            if HMAJOR is not None and ( HMAJOR < 19 or ( HMAJOR == 19 and (HMINOR or 0) < 5 ) ):
+                # If this is true, Houdini is below the version number where pip is included in it's python instalation. Additional checks will be run.
+                print( f"pip not installed by default in this version of Houdini ({HMAJOR}.{HMINOR})! Checking for an existing installation.")
+                pipstatus = check_install_pip(session=session)
+                if not pipstatus:
+                    raise Exception("pip could not be found or installed. Typecaster install process terminated.")
+                    return False
+
+            success, stdout, stderr = session.run_pip(*__pip_install_args__(TYPECASTER_PYTHON_INSTALL_PATH), stream=True)
     if success:
         print("Dependency install process executed successfully")
+        (TYPECASTER_PYTHON_INSTALL_PATH / REQUIREMENTS_STAMP_NAME).write_text(stamp)
     else:
         print("Dependency install process failed with error:")
         print(stderr.decode())
 
     # Update houdini path in-place
-    if success and TYPECASTER_PYTHON_INSTALL_PATH not in sys.path:
-        print(f"Adding {TYPECASTER_PYTHON_INSTALL_PATH} to path")
-        sys.path.insert(0, str(TYPECASTER_PYTHON_INSTALL_PATH))
+    if success and __prepend_sys_path__(TYPECASTER_PYTHON_INSTALL_PATH):
+        print(f"Added {TYPECASTER_PYTHON_INSTALL_PATH} to path")
     return success
 
 
 def clear_dependencies():
     """Clear any existing pythonX.XXlibs folders."""
+    import shutil
     # This a straightforward way to ensure that the secondary python packages used by
     # Typecaster don't get out of step with the versions expected in the current commit.
     print(f"Removing existing pythonX.XXlibs folders in {TYPECASTER_ROOT_PATH}.")
-    for f in TYPECASTER_ROOT_PATH.iterdir():
-        if f.is_dir():
-            if re.match("python\d\.\d{1,2}libs", f.name):
-                print(f"""Removing folder "{f.name}" and it's contents...""")
-                try:
-                    shutil.rmtree(f)
-                    print(f"""Folder "{f.name}" and it's contents removed successfully!""")
-                except OSError as e:
-                    print(f"Error: {f} : {e.strerror}")
+    errors = []
+    # scandir gets the entry type from the directory listing itself, avoiding a stat per entry
+    with os.scandir(TYPECASTER_ROOT_PATH) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False) and _PYLIB_RE.match(entry.name):
+                print(f"""Removing folder "{entry.name}" and it's contents...""")
+                errorcount = len(errors)
+                shutil.rmtree(entry.path, onerror=lambda func, path, exc_info: errors.append((path, exc_info[1])))
+                if len(errors) == errorcount:
+                    print(f"""Folder "{entry.name}" and it's contents removed successfully!""")
+    for path, e in errors:
+        print(f"Error: {path} : {e.strerror if isinstance(e, OSError) else e}")
+
+
+def __stash__(discard_changes=False):
+    """Stash any changes made to the repo, permanently discarding them if requested.
+
+    Returns:
+        bool: True if the update process can continue.
+    """
+    success = __rungit__("stash")[0]
+    if discard_changes:
+        # Matches the previous "git stash && git stash drop ; ..." behaviour, where discarding never blocked the update.
+        if success:
+            __rungit__("stash", "drop", do_print=False)
+        return True
+    return success
+
+
+def __start_fetch__():
+    """Start fetching from origin in the background.
+
+    A fetch only touches the object database and remote refs, so it can overlap with
+    getting the releases from github rather than waiting for it.
+
+    Nothing is printed from the background thread, since the standalone GUI's print isn't thread-safe.
+    Any error is printed by __fetch_and_checkout__ once the result is retrieved.
+
+    Returns:
+        concurrent.futures.Future: The result of the fetch, as returned by __rungit__.
+    """
+    import concurrent.futures
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    # A single fetch covers both the branches and (force-updated, pruned) tags, so the remote is only contacted once.
+    fetch = executor.submit(__rungit__, *_FETCH_ARGS, do_print=False)
+    executor.shutdown(wait=False)
+    return fetch
+
+
+def __fetch_and_checkout__(ref:str, fetch=None, discard_changes=False):
+    """Wait on the fetch from origin (starting one if not given), then stash any changes and checkout ref if that succeeded."""
+    result = (fetch or __start_fetch__()).result()
+    if not result[0]:
+        print(f'Running command "git {" ".join(_FETCH_ARGS)}" failed with the following error:')
+        print(result[2].decode())
+    else:
+        # The stash waits on the fetch, so that the two don't compete for the repo's locks.
+        if not __stash__(discard_changes):
+            return False, bytes(), bytes()
+        result = __rungit__("checkout", ref)
+    return result
 
 
 def update(mode:str=None, release:str=None, discard_changes=False, branch=None, force_clear=False):
@@ -134,26 +545,33 @@ def update(mode:str=None, release:str=None, discard_changes=False, branch=None,
     """        
     # print("Updating Typecaster from github...")
     dependency_update = False
-    discardcmd = f"git stash && {'git stash drop ; ' if discard_changes else ''}"
-    fetchcmd = 'git fetch origin && git fetch --prune origin "+refs/tags/*:refs/tags/*" && '
-    reqhash = __get_filehash__(REQUIREMENTS_PATH)
+    # The commit before updating. This allows git to report if requirements.txt changed, rather than hashing it before and after.
+    success, stdout, stderr = __rungit__("rev-parse", "HEAD", do_print=False)
+    prerev = stdout.decode().strip() if success else None
+    postrev = None
+    # Releases are checked out from a fresh fetch, which can run while the releases are retrieved from github.
+    fetch = __start_fetch__() if mode in ('latest_stable_release', 'latest_release', 'release_tag') else None
 
     if mode == 'latest_commit':
         # Pull the latest commit
         print("Updating to the latest commit")
-        dependency_update, stdout, stderr = __runcmd__(f"{discardcmd}git checkout {branch if branch else 'main'} && git pull")
-        # Ideally I'll figure out a way to reimplement this, but it doesn't properly handle multiple operations being run in the same command
-        # if dependency_update:
-        #     if stdout.decode().endswith("Already up to date.\n"):
-        #         print("Already on the latest commit!")
-        #         dependency_update = False
+        if __stash__(discard_changes):
+            dependency_update, stdout, stderr = __rungit__("checkout", branch if branch else 'main')
+            if dependency_update:
+                prepull = __rungit__("rev-parse", "HEAD", do_print=False)[1].decode().strip()
+                dependency_update, stdout, stderr = __rungit__("pull")
+            # Comparing commits rather than git's output doesn't depend on the user's language.
+            if dependency_update:
+                postrev = __rungit__("rev-parse", "HEAD", do_print=False)[1].decode().strip()
+                if postrev == prepull:
+                    print("Already on the latest commit!")
 
     elif mode == 'latest_stable_release':
         # Checkout the latest normal release
         print("Updating to the latest stable release")
         rels = get_releases()['stable']
         if rels:
-            dependency_update, stdout, stderr = __runcmd__(f"{discardcmd}{fetchcmd}git checkout {rels[0]}")
+            dependency_update, stdout, stderr = __fetch_and_checkout__(rels[0], fetch, discard_changes)
         else:
             raise Exception('<TYPECASTER ERROR> No stable releases found!')
 
@@ -162,7 +580,7 @@ def update(mode:str=None, release:str=None, discard_changes=False, branch=None,
         print("Updating to the latest release")
         rels = get_releases()['all']
         if rels:
-            dependency_update, stdout, stderr = __runcmd__(f"{discardcmd}{fetchcmd}git checkout {rels[0]}")
+            dependency_update, stdout, stderr = __fetch_and_checkout__(rels[0], fetch, discard_changes)
 
     elif mode == 'release_tag':
         # Checkout a user-defined release tag
@@ -172,19 +590,20 @@ def update(mode:str=None, release:str=None, discard_changes=False, branch=None,
         else:
             print(f"Updating to release {release}...")
             if release in rels:
-                dependency_update, stdout, stderr = __runcmd__(f"{discardcmd}{fetchcmd}git checkout {release}")
+                dependency_update, stdout, stderr = __fetch_and_checkout__(release, fetch, discard_changes)
             else:
                 raise Exception(f'<TYPECASTER ERROR> Invalid release {release} specified!')
 
     else:
         raise Exception(f'<TYPECASTER ERROR> Unknown update mode of {mode} specified!')
 
-    newreqhash = __get_filehash__(REQUIREMENTS_PATH)
     updated = dependency_update
-    if not force_clear and dependency_update and reqhash and reqhash == newreqhash:
+    # git diff --quiet only succeeds if there are no differences in the file between the two commits.
+    # If the previous commit couldn't be found the dependencies are always reinstalled, just to be safe.
+    # If HEAD is known not to have moved there's no need to ask git.
+    if not force_clear and dependency_update and prerev and (postrev == prerev or __rungit__("diff", "--quiet", prerev, "HEAD", "--", REQUIREMENTS_PATH.name, do_print=False)[0]):
         print(f"{REQUIREMENTS_PATH.name} is unchanged. Preserving dependencies.")
         dependency_update = False
-        updated = True
 
     if dependency_update:
         # Since typecaster might be installed to multiple houdini versions at once,
@@ -212,27 +631,32 @@ def check_install(auto_install=True, force_if_not_valid=False):
     """
     validinstall = False
     # The following is requred for compatibility with H21.0.440, which includes a broken version of fontTools.
-    if HMAJOR>=21:
-        print("<TYPECASTER> TEMPFIX: Prepending python path with Typecaster libs (included fontTools override)")
-        sys.path.insert(0, str(TYPECASTER_PYTHON_INSTALL_PATH))
-    try:
-        from typecaster.font import Font # noqa: F401
-        del Font
-        from typecaster.fontFinder import FONTFILES # noqa: F401
-        del FONTFILES
-        from typecaster.bidi_segmentation import line_to_run_segments # noqa: F401
-        del line_to_run_segments
+    if HMAJOR is not None and HMAJOR>=21:
+        if __prepend_sys_path__(TYPECASTER_PYTHON_INSTALL_PATH, require_first=True):
+            print("<TYPECASTER> TEMPFIX: Prepending python path with Typecaster libs (included fontTools override)")
+    # These are actually imported (rather than just located), since a broken dependency only shows up
+    # when it's executed. A failed import never stays in sys.modules, so once they're all there the
+    # import machinery doesn't need to be entered again on later checks.
+    if all(name in sys.modules for name in _REQUIRED_MODULES):
         validinstall = True
-    except ImportError or ModuleNotFoundError:
-        validinstall = False
+    else:
+        try:
+            import importlib
+            for name in _REQUIRED_MODULES:
+                importlib.import_module(name)
+            validinstall = True
+        except ImportError:
+            # Also covers ModuleNotFoundError, which is a subclass of ImportError
+            validinstall = False
 
     if not validinstall:
         print("Typecaster could not be initialized properly. Are the dependencies installed?")
+        # Typecaster couldn't be imported, so an existing install can't be trusted regardless of what requirements.txt it came from.
         if force_if_not_valid:
-            validinstall = install_dependencies()
+            validinstall = install_dependencies(force=True)
         elif auto_install and config.get_config().get("auto_install_python_dependencies", 0) == 1:
             print("Auto-install is enabled in the config. Attempting install.")
-            validinstall = install_dependencies()
+            validinstall = install_dependencies(force=True)
         else:
             print("""Auto-install is disabled. Please either run the installer from the shelf tool, or run typecaster.installer.install_dependencies() from a python shell.""")
     elif force_if_not_valid:
@@ -240,14 +664,25 @@ def check_install(auto_install=True, force_if_not_valid=False):
     return validinstall
 
 
-def check_install_pip(auto_install=True):
+def check_install_pip(auto_install=True, session:HythonSession=None):
     """Check if pip in installed to the current python environment, and attempt to install it if not.
 
+    Args:
+        auto_install (bool, optional): Attempt to install pip if it can't be found. Defaults to True.
+        session (HythonSession, optional): An existing hython session to run everything in.
+            A temporary one is used if not specified.
+
     Raises:
         Exception: Raised if pip couldn't be run AND it couldn't be installed.
     """    
+    if session is None:
+        with HythonSession() as session:
+            return check_install_pip(auto_install=auto_install, session=session)
+
+    import importlib.util
     print("Attempting to run pip...")
-    success, stdout, stderr = __runcmd__("hython -m pip", do_print=False)
+    # hython uses the same python as this process, so if pip can be found here there's no need to ask it.
+    success = importlib.util.find_spec("pip") is not None or session.run("import pip")[0]
 
     haspip = False
     if success:
@@ -256,35 +691,126 @@ def check_install_pip(auto_install=True):
     elif auto_install:
         print("pip could not be run. Attempting install...")
 
-        pipgetpath = (Path(os.getenv("HOUDINI_TEMP_DIR"))/"get-pip.py").resolve()
-        pipgetpath.parent.mkdir(exist_ok=True)
         if sys.version_info.major < 3 or (sys.version_info.major == 3 and sys.version_info.minor < 9):
             # Main script only supports python 3.9 or higher, so get a version specific one.
             url = f"https://bootstrap.pypa.io/pip/{PYTHON_VERSION}/get-pip.py"
+            # Each version specific script is kept separately, since Houdini versions share the temp dir.
+            pipgetpath = Path(os.getenv("HOUDINI_TEMP_DIR"))/f"get-pip-{PYTHON_VERSION}.py"
         else:
             url = "https://bootstrap.pypa.io/pip/get-pip.py"
+            pipgetpath = Path(os.getenv("HOUDINI_TEMP_DIR"))/"get-pip.py"
+        if not pipgetpath.parent.is_dir():
+            pipgetpath.parent.mkdir(parents=True, exist_ok=True)
 
-        # Download pip installer
-        success, stdout, stderr = __runcmd__(f"curl {url} -o {str(pipgetpath)}",do_print=False)
+        # Download pip installer, reusing one from a previous install if it's recent or hasn't changed
+        try:
+            if pipgetpath.exists() and time.time() - pipgetpath.stat().st_mtime < GETPIP_MAX_AGE:
+                print("Using recently downloaded get-pip.py.")
+            elif __download__(url, pipgetpath, if_modified=True):
+                print("get-pip.py successfully downloaded.")
+            else:
+                print("get-pip.py is already up to date.")
+                # Now known to be current, so it can be reused without asking again for a while
+                pipgetpath.touch()
+            success = True
+        except OSError as e:
+            success = False
+            print("get-pip.py download process failed with error:")
+            print(e)
         if success:
-            print("get-pip.py successfully downloaded.")
             print("Running get-pip.py...")
             # Run pip installer
-            success, stdout, stderr = __runcmd__(f"hython {pipgetpath}",do_print=False)
+            success, stdout, stderr = session.run(_GETPIP_SRC.format(path=str(pipgetpath)))
             if success:
                 print("pip install process success!")
                 haspip = True
             else:
                 print("pip install process failed with error:")
                 print(stderr.decode())
-        else:
-            print("get-pip.py download process failed with error:")
-            print(stderr.decode())
     else:
         print("pip could not be run, and auto_install has been disabled!")
     return haspip
 
 
+def __get_releases_json__():
+    """Get the parsed json of all releases on github, reusing a recent response when possible.
+
+    The response is kept in memory for RELEASES_CACHE_TTL seconds, and written along with its ETag to
+    $HOUDINI_TEMP_DIR/typecaster_releases.json so that back-to-back CLI runs can skip the network
+    for RELEASES_DISKCACHE_TTL seconds. Once that expires, the ETag is sent back as a conditional
+    request, and a 304 response reuses the cached payload (which doesn't count against the rate limit).
+    """
+    import json
+    import tempfile
+    try:
+        # orjson is considerably faster, and parses bytes directly. It isn't a dependency, but is used if it's available.
+        from orjson import loads as json_loads
+    except ImportError:
+        json_loads = json.loads
+    global _releases_cache
+    if _releases_cache is not None and time.monotonic() - _releases_cache[0] < RELEASES_CACHE_TTL:
+        return _releases_cache[1]
+
+    url = TYPECASTER_URL + "/releases"
+    cachepath = Path(os.getenv("HOUDINI_TEMP_DIR", tempfile.gettempdir())) / "typecaster_releases.json"
+    j_data = None
+    cache = {}
+    try:
+        cache = json_loads(cachepath.read_bytes())
+        if time.time() - cache['fetched_at'] < RELEASES_DISKCACHE_TTL:
+            j_data = cache['payload']
+    except (OSError, ValueError, KeyError, TypeError):
+        cache = {}
+
+    if j_data is None:
+        # GitHub rejects requests without a User-Agent. requests already asks for gzip, but urlopen has to be told to.
+        headers = {"Accept": "application/vnd.github+json", "User-Agent": "Typecaster-Installer"}
+        if cache.get('etag') and isinstance(cache.get('payload'), list):
+            headers["If-None-Match"] = cache['etag']
+        etag = None
+        session = __get_session__()
+        if session is not None:
+            r = session.get(url, headers=headers, verify=True, timeout=10)
+            if r.status_code == 304:
+                j_data, etag = cache['payload'], cache['etag']
+            else:
+                r.raise_for_status()
+                if not r.content:
+                    raise ValueError("No response from release server: {}".format(url))
+                j_data = json_loads(r.content)
+                etag = r.headers.get("ETag")
+        else:
+            try:
+                with contextlib.closing(urlopen(Request(url, headers=dict(headers, **{"Accept-Encoding": "gzip"})), context=ssl._create_unverified_context())) as response:
+                    data = response.read()
+                    if not data:
+                        raise ValueError("No response from release server: {}".format(url))
+                    if response.headers.get("Content-Encoding") == "gzip":
+                        import gzip
+                        data = gzip.decompress(data)
+                    j_data = json_loads(data)
+                    etag = response.headers.get("ETag")
+            except HTTPError as e:
+                if e.code != 304:
+                    raise
+                j_data, etag = cache['payload'], cache['etag']
+        # Only a list is a valid response. Anything else (like a rate limit message) shouldn't be reused.
+        if isinstance(j_data, list):
+            try:
+                cachepath.parent.mkdir(parents=True, exist_ok=True)
+                # Written alongside and then swapped in, so another process never reads a partially written cache.
+                tmppath = cachepath.with_name(f"{cachepath.name}.{os.getpid()}.tmp")
+                with tmppath.open('w') as f:
+                    json.dump({'etag': etag, 'fetched_at': time.time(), 'payload': j_data}, f)
+                os.replace(tmppath, cachepath)
+            except OSError:
+                pass
+
+    if isinstance(j_data, list):
+        _releases_cache = (time.monotonic(), j_data)
+    return j_data
+
+
 def get_releases(ignore_error=False):
     """get a list of all releases on github.
 
@@ -293,22 +819,18 @@ def get_releases(ignore_error=False):
     """
     releases = {'stable':[],'experimental':[],'all':[]}
     found = False
-    with contextlib.closing(urlopen(Request(TYPECASTER_URL + "/releases"), context=ssl._create_unverified_context())) as response:
-        data = response.read()
-        if data == "":
-            raise ValueError("No response from release server: {}".format(TYPECASTER_URL + "/releases"))
-        j_data = json.loads(data.decode('utf-8'))
-        try:
-            for release in j_data:
-                tag_name:str = release["tag_name"]
-                if tag_name.endswith('e'):
-                    releases['experimental'].append(tag_name)
-                else:
-                    releases["stable"].append(tag_name)
-                releases['all'].append(tag_name)
-                found = True
-        except TypeError:
-            raise ValueError("Rate limit reached. Please try again later.")
+    j_data = __get_releases_json__()
+    try:
+        for release in j_data:
+            tag_name:str = release["tag_name"]
+            if tag_name.endswith('e'):
+                releases['experimental'].append(tag_name)
+            else:
+                releases["stable"].append(tag_name)
+            releases['all'].append(tag_name)
+            found = True
+    except TypeError:
+        raise ValueError("Rate limit reached. Please try again later.")
     if found or ignore_error:
         return releases
     else:
@@ -324,50 +846,49 @@ def get_update_cmd(mode:str=None, release:str=None, discard_changes=False, branc
     #     code = f"""& "{pexec.as_posix()}" """
 
     if explicit_path:
-        code += TYPECASTER_ROOT_PATH.as_posix()
+        code += _TYPECASTER_ROOT_POSIX
     else:
         if PLATFORM == "WINDOWS":
             code += "%TYPECASTER%"
         else:
             code += "$TYPECASTER"
-    code += '/pythonlibs/typecaster/installer.py" cli --o update '
+    code += '/pythonlibs/typecaster/installer.py" cli --o update'
+    args = []
     if mode == "latest_commit":
-        code += "--r lc"
+        args.append("--r lc")
     elif mode == "latest_stable_release":
-        code += "--r ls"
+        args.append("--r ls")
     elif mode == "latest_release":
-        code += "--r lr"
+        args.append("--r lr")
     elif mode == "release_tag":
-        code += f"--r {release}"
+        args.append(f"--r {release}")
 
     if discard_changes:
-        code += "--d"
+        args.append("--d")
 
     if branch:
-        code += f"--b {branch}"
+        args.append(f"--b {branch}")
 
     if force_clear:
-        code += "--c"
+        args.append("--c")
 
-    return code
+    return " ".join([code, *args])
 
 
 def launch_gui():
     print("Launching standalone GUI for Typecaster. Please wait...")
-    cmd = f"hython {__file__} gui"
+    cmd = ["hython", __file__, "gui"]
+    # Popen doesn't wait for the process, so the GUI runs in the background without needing a shell.
     if PLATFORM == "WINDOWS":
-        cmd = f"start /B {cmd}"
+        subprocess.Popen(cmd)
     else:
-        cmd = f"nohup {cmd} &"
-    subprocess.run(cmd, shell=True)
+        subprocess.Popen(cmd, start_new_session=True)
 
 
 if __name__ == "__main__":
     import argparse
     
     print("\n<TYPECASTER> Running Typecaster Installer outside of a Houdini session")
-    MODEOPTIONS = (('latest_stable_release','ls'), ('latest_commit','lc'), ('latest_release','lr'), ('release_tag','release','r'))
-    MODEOPTIONS_FLAT = [item for sublist in MODEOPTIONS for item in sublist]
         
     parser = argparse.ArgumentParser()
     parser.add_argument("standalone_mode", help='How you would like to use the installer. Options are "gui", "cli", and "none" to run without either.')
@@ -375,6 +896,7 @@ if __name__ == "__main__":
     parser.add_argument("-r", "--release", help='What release to use. Options are "ls" for latest stable release, "lr" for latest release, "lc" for latest commit, or a specific release (eg: "1.0.0e").')
     parser.add_argument("-c", "--clear", action='store_true', help='When enabled, clear anything in the pythonX.XXlibs folders.')
     parser.add_argument("-d", "--discard_changes", action='store_true', help='When enabled and the operation is "update", any changes made to the repo will be discarded.')
+    parser.add_argument("-f", "--force_reinstall", action='store_true', help='When enabled and the operation is "install_dependencies", pip is run even if the dependencies are already installed from the current requirements.txt.')
     parser.add_argument("-b", "--branch", help='A specific branch to use when release is set to "latest commit". Defaults to "main" when not set.')
 
     args = parser.parse_args()
@@ -398,17 +920,10 @@ if __name__ == "__main__":
             clear = args.clear
             if args.release:
                 branch = args.branch
-                if args.release in MODEOPTIONS_FLAT:
-                    if args.release in MODEOPTIONS[0]:
-                        # Update using latest stable version
-                        print("Updating to the latest stable release.")
-                        mode = 'latest_stable_release'
-                    elif args.release in MODEOPTIONS[1]:
-                        mode = 'latest_commit'
-                    elif args.release in MODEOPTIONS[2]:
-                        print("Updating to the latest release.")
-                        mode = 'latest_release'
-                else:
+                mode = _MODE_LOOKUP.get(args.release)
+                if mode == 'release_tag':
+                    raise Exception("<TYPECASTER ERROR> Please specify the release itself (eg: \"1.0.0e\") rather than the release_tag option!")
+                elif mode is None:
                     # Check if the string is an existing release and update using it if so.
                     print("Release specified. Likely a specific version.")
                     rels = get_releases()['all']
@@ -418,33 +933,26 @@ if __name__ == "__main__":
                     else:
                         raise Exception("<TYPECASTER ERROR> The release you specified doesn't exist!")
             else:
-                selection = ''
                 print(f'How would you like to update? \nOptions are:\n    {MODEOPTIONS[3]}: Select a specfic release.\n    {MODEOPTIONS[0]}: Use the latest stable release.\n    {MODEOPTIONS[2]}: Use the latest release.\n    {MODEOPTIONS[1]}: Use the latest commit. Most unstable.')
-                while selection not in MODEOPTIONS_FLAT:
-                    selection = input("Selection: ").lower()
-                    if selection not in MODEOPTIONS_FLAT:
-                        print("Please select a valid option!")
-                if selection in MODEOPTIONS[0]:
-                    mode = 'latest_stable_release'
-                elif selection in MODEOPTIONS[1]:
-                    mode = 'latest_commit'
-                elif selection in MODEOPTIONS[2]:
-                    mode = 'latest_release'
-                elif selection in MODEOPTIONS[3]:
+                while True:
+                    mode = _MODE_LOOKUP.get(input("Selection: ").strip().lower())
+                    if mode:
+                        break
+                    print("Please select a valid option!")
+                if mode == 'release_tag':
                     rels = get_releases()['all']
-                    print("Recent releases:", rels[0:8 if len(rels) >= 8 else len(rels)])
-                    selection = ''
-                    while release not in rels:
-                        release = input("Selection: ")
-                        if release not in rels:
-                            print("Please select a valid option!")
-                    mode = 'release_tag'
+                    print("Recent releases:", list(rels[:8]))
+                    while True:
+                        release = input("Selection: ").strip()
+                        if release in rels:
+                            break
+                        print("Please select a valid option!")
             update(mode=mode, release=release, discard_changes=args.discard_changes, branch=branch, force_clear=clear)
 
         elif operation in op_options[1]:
             if args.clear:
                 clear_dependencies()
-            install_dependencies()
+            install_dependencies(force=args.force_reinstall)
 
         else:
             print("<TYPECASTER ERROR> Please specify a valid operation!")
@@ -7,18 +7,19 @@ There's basically no reason to use this submodule outside of the Typecaster::typ
 """
 
 from __future__ import annotations
+import functools
+import itertools
 import hou
 from pathlib import Path, WindowsPath, PosixPath  # noqa: F401
 from pathops import Path as PathopsPath
 
 from typecaster import font as tcf
-from typecaster.houdiniPen import HoudiniCubicPen, HoudiniQuadraticPen
+from typecaster.houdiniPen import getHoudiniPen
 from typecaster.bidi_segmentation import line_to_run_segments
 from typecaster.fontUI import ensure_compatible_name
 import uharfbuzz as hb
 
 GFLAG_UNSAFE_TO_BREAK = hb.GlyphFlags.UNSAFE_TO_BREAK
-# import cProfile
 
 CHARS_WHITESPACE_NO = (
     # Related Unicode characters with property White_Space=no
@@ -30,29 +31,17 @@ CHARS_WHITESPACE_NO = (
     chr(0xFEFF), # Zero width non-breaking space (NOBREAK)
 )
 
-# pt_attribs = {'skeltype' : [], 
-#               'gsz' : [],
-#               'ids' : [],
-#               'gshift' : []
-# }
-
-# def increment_point_attribs(skeltype:str="", gsz=[], ids=[], gshift=(0.,0.) ):
-#     pt_attribs['skeltype'].append(skeltype)
-#     pt_attribs['gsz'].append(gsz)
-#     pt_attribs['ids'].append(ids)
-#     pt_attribs['gshift'].append(gshift)
-    
-# def createPoint_delayedAttribs(skeltype:str="", gsz=[], ids=[], gshift=(0.,0.) ):
-#     increment_point_attribs(gshift=gshift,gsz=gsz,ids=ids,skeltype=skeltype)
-#     return geo.createPoint()
+# The only names which can show up in the string representation of interpret_font_parms_min
+__FONT_INFO_NAMES = { "Path" : Path, "WindowsPath" : WindowsPath, "PosixPath" : PosixPath }
+
+@functools.lru_cache(maxsize=16)
+def __parse_font_info( font_info_string:str) -> tuple:
+    """Parse the string from the font_info parameter, caching the result since the value rarely changes between cooks.
 
-# def dump_point_attribs():
-#     print( len(geo.points()) )
-#     print( len(tuple(pt_attribs['skeltype'])) )
-#     geo.setPointStringAttribValues('skeltype', tuple(pt_attribs['skeltype']) )
-#     geo.setPointIntAttribValues('gsz', tuple(pt_attribs['gsz']) )
-#     geo.setPointIntAttribValues('ids', tuple(pt_attribs['ids']) )
-#     geo.setPointFloatAttribValues('gshift', tuple(pt_attribs['gshift']) )
+    Since the string contains path objects it can't be handled by ast.literal_eval, so it is evaluated
+    with access only to the path classes instead.
+    """
+    return eval(font_info_string, {"__builtins__": {}}, __FONT_INFO_NAMES)
 
 
 def get_tcf_from_fontinfo(node) -> tcf.Font:
@@ -67,7 +56,7 @@ def get_tcf_from_fontinfo(node) -> tcf.Font:
     Returns:
         tcf.Font: typecaster.Font object
     """
-    font_info = eval(node.evalParm("font_info"))
+    font_info = __parse_font_info(node.evalParm("font_info"))
     try:
         return tcf.Font.Cacheable(font_info[0], number=font_info[1])
     except tcf.FontInitFailure as e:
@@ -159,6 +148,65 @@ def __make_dir( run_dir:int, line_dir:int):
     return run_dir + (2+(2*(line_dir if line_dir != -1 else run_dir)))
 
 
+__FEATURE_FOLDER_NAMES = ("general_features", "stylistic_sets", "character_variants")
+__FEATURE_PARM_NAMES_CACHE = {}
+
+def __get_feature_parm_names( interfacenode:hou.OpNode) -> tuple[str]:
+    """Get the names of all the parameters within the feature folders of a Typecaster interface.
+
+    The folder layout only changes when the asset's definition does, so the names are cached per HDA definition.
+
+    Args:
+        interfacenode (hou.OpNode): The node which has all of the standard parameters to drive typecaster.
+
+    Returns:
+        tuple[str]: Names of every feature parameter, in folder order.
+    """
+    """
+    FIXME:
+    Ok for reasons that are beyond my comprehension the second the top-level parameter folders are set to tabs,
+    it becomes essentially impossible to access the folders normally. While they might appear normal in the type
+    properties pane, looking at the parameter interface of an actual placed node reveals that a number gets
+    appended to the name of almost every single folder.
+
+    It appears to correspond to the number of elements in the folder set +1. So for example:
+    type_config      ---> type_config4 (It has 3 elements in it's set of tabs)
+    general_features ---> general_features2 (It's a simple folder so it only has one folder)
+
+    This behavior doesn't happen in a non-HDA version of the interface, so it must be some quirk exclusive to HDAs.
+    It's worth noting that this also happens on native SideFX nodes like the Sop FLIP solver node.
+
+    EVEN MORE annoyingly, this doesn't seem to be the case when the node is in it's default state, or at least
+    it is still possible to access the folders using their intended names, so it's necessesary to add an extra
+    condition for every single folder accessed to first try it's intended name and then a version with the number appended.
+
+    This honestly isn't too expensive to account for, but it inhenrently requires this script to remain directly coupled to
+    the asset since the number being appended is completely dependent on the interface it is accessing. While it's likley
+    possible to do this programatically by getting then length of the set of folder names with the FolderSetParmTemplate,
+    I don't want to give in to this issue by affording it any more computation than is absolutely needed.
+    """
+    definition = interfacenode.type().definition()
+    key = None
+    if definition is not None:
+        key = (definition.libraryFilePath(), definition.nodeTypeName(), definition.modificationTime())
+        names = __FEATURE_PARM_NAMES_CACHE.get(key)
+        if names is not None:
+            return names
+
+    ptg = interfacenode.parmTemplateGroup()
+    names = []
+    for folder_name in __FEATURE_FOLDER_NAMES:
+        targetfolder = ptg.find(folder_name)
+        if not targetfolder:
+            targetfolder = ptg.find(folder_name+'2')
+        names.extend( parm.name() for parm in targetfolder.parmTemplates() )
+    names = tuple(names)
+
+    if key is not None:
+        __FEATURE_PARM_NAMES_CACHE[key] = names
+    return names
+
+
 def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry):
     """Main operation for taking a Typecaster font interface and outputting 
     both a series of glyph control points and a skeleton for layout and positioning.
@@ -232,15 +280,14 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
     These results are shockingly consistent, but incomprehensible.
     I literally cannot explain this in the slightest.
     """
-    # profiler = cProfile.Profile(subcalls=False, builtins=False)
-    # profiler.enable(subcalls=False, builtins=False)
-    
     textparm = interfacenode.parm('text')
     src_text = textparm.eval() if textparm else ''
     src_text_stripped = ''.join(c for c in src_text if c not in CHARS_WHITESPACE_NO)
     typecasterfont = get_tcf_from_fontinfo(node)
 
     fontgoggle = typecasterfont.font
+    # The uharfbuzz font is used for every glyph, so it's only looked up once
+    hbfont = fontgoggle.shaper.font
     # ttfont:ttLib.TTFont = fontgoggle.ttFont
     # glyphSet = fontgoggle.ttFont.getGlyphSet()
 
@@ -253,15 +300,16 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
     attrib_prim_ids = geo.addArrayAttrib(hou.attribType.Prim, "ids", hou.attribData.Int)
 
     # These are only used by the skeleton
-    attrib_skeltype = geo.addAttrib(hou.attribType.Point, "skeltype", "", create_local_variable=False)
+    geo.addAttrib(hou.attribType.Point, "skeltype", "", create_local_variable=False)
     attrib_gsz = geo.addArrayAttrib(hou.attribType.Point, "gsz", hou.attribData.Float)
-    attrib_gshift = geo.addAttrib(hou.attribType.Point, "gshift", (0.,0.), create_local_variable=False)
+    geo.addAttrib(hou.attribType.Point, "gshift", (0.,0.), create_local_variable=False)
     grp_skel = geo.createPointGroup('skeleton')
 
     # Try and get the vertical height of the given glyph, and if there isn't one assume that
     # we're working with a standard Latin font and get the general glyph height
     vmtx = fontgoggle.ttFont.get('vmtx')
-    general_glyph_height = typecasterfont.general_glyph_height
+    vmtx_heights = {}
+    general_glyph_height = float(typecasterfont.general_glyph_height)
 
     # Set the overall scale of each glyph to be applied in Houdini, to ensure general sizing is consistent between fonts.
     upem = fontgoggle.unitsPerEm
@@ -280,55 +328,8 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
     # Maximum value for stable_idx, accounting for cluster size
     attrib_stable_idx_max = geo.addAttrib(hou.attribType.Global, "stable_idx_max", 0, create_local_variable=False)
 
-    # Find all the feature folders and get the value of the parameters within
-    ptg = interfacenode.parmTemplateGroup()
-    featfolder_name = "general_features"
-    ssfolder_name = "stylistic_sets"
-    cvfolder_name = "character_variants"
-
-    # folder = ptg.find(featfolder_name)
-    # features = { parm.name() : interfacenode.parm(parm.name()).eval() == 1 for parm in folder.parmTemplates() }
-    # folder = ptg.find(ssfolder_name)
-    # features.update({ parm.name() : interfacenode.parm(parm.name()).eval() == 1 for parm in folder.parmTemplates() })
-    # folder = ptg.find(cvfolder_name)
-    # features.update({ parm.name() : interfacenode.parm(parm.name()).eval() == 1 for parm in folder.parmTemplates() })
-    """
-    FIXME:
-    Ok for reasons that are beyond my comprehension the second the top-level parameter folders are set to tabs,
-    it becomes essentially impossible to access the folders normally. While they might appear normal in the type
-    properties pane, looking at the parameter interface of an actual placed node reveals that a number gets
-    appended to the name of almost every single folder.
-
-    It appears to correspond to the number of elements in the folder set +1. So for example:
-    type_config      ---> type_config4 (It has 3 elements in it's set of tabs)
-    general_features ---> general_features2 (It's a simple folder so it only has one folder)
-
-    This behavior doesn't happen in a non-HDA version of the interface, so it must be some quirk exclusive to HDAs.
-    It's worth noting that this also happens on native SideFX nodes like the Sop FLIP solver node.
-
-    EVEN MORE annoyingly, this doesn't seem to be the case when the node is in it's default state, or at least
-    it is still possible to access the folders using their intended names, so it's necessesary to add an extra
-    condition for every single folder accessed to first try it's intended name and then a version with the number appended.
-
-    This honestly isn't too expensive to account for, but it inhenrently requires this script to remain directly coupled to
-    the asset since the number being appended is completely dependent on the interface it is accessing. While it's likley
-    possible to do this programatically by getting then length of the set of folder names with the FolderSetParmTemplate,
-    I don't want to give in to this issue by affording it any more computation than is absolutely needed.
-    """
-    targetfolder = ptg.find(featfolder_name)
-    if not targetfolder:
-        targetfolder = ptg.find(featfolder_name+'2')
-    features = { parm.name() : interfacenode.parm(parm.name()).evalAsInt() for parm in targetfolder.parmTemplates() }
-
-    targetfolder = ptg.find(ssfolder_name)
-    if not targetfolder:
-        targetfolder = ptg.find(ssfolder_name+'2')
-    features.update({ parm.name() : interfacenode.parm(parm.name()).evalAsInt() for parm in targetfolder.parmTemplates() })
-
-    targetfolder = ptg.find(cvfolder_name)
-    if not targetfolder:
-        targetfolder = ptg.find(cvfolder_name+'2')
-    features.update({ parm.name() : interfacenode.parm(parm.name()).evalAsInt() for parm in targetfolder.parmTemplates() })
+    # Get the value of all of the feature parameters
+    features = { name : interfacenode.evalParm(name) for name in __get_feature_parm_names(interfacenode) }
     # While incredibly uncommon, the font family Monaspace is an example of allowing
     # for values greater than one for it's character variants. Even though these
     # parameters are created as toggles, they can/should also be interpeted as integers.
@@ -338,12 +339,15 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
     font_using_kern = True if 'kern' in featuresGPOS and features.get('kern', True) else False
 
     # Read in the parameter setting for preprocessing glyphs for when variation axes should cause glyph swaps.
-    # TODO: I think it's possible to identify if the opentype table for varaxes GSUBs is present and only
-    # use this setting if it's needed. Not sure though. Since this operation is super expensive I'd like to
-    # prevent it from running whenever possible.
     tparm:hou.Parm = interfacenode.parm('reprocess_varying_for_glyphsub')
     reprocess_for_glyphswap = tparm.eval() if tparm else False
     del tparm
+    # Variation axes can only cause glyph swaps through the FeatureVariations of the GSUB table, so since
+    # reprocessing is super expensive, it's skipped entirely for fonts that don't have any.
+    if reprocess_for_glyphswap:
+        gsub = fontgoggle.ttFont.get('GSUB')
+        if gsub is None or getattr(gsub.table, 'FeatureVariations', None) is None:
+            reprocess_for_glyphswap = False
 
     tparm:hou.Parm = interfacenode.parm('reshape_entire_run_during_varying')
     reshape_entire_run_for_varying = tparm.eval() if tparm else False
@@ -374,6 +378,13 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
         except IndexError:
             hpoints = []
 
+        # Only the axes which are actually present on the incoming points need to be read per-glyph
+        active_axes = []
+        for var in variation_axes:
+            varcompat = ensure_compatible_name(var)
+            if varcompat in attribstatus:
+                active_axes.append( (var, varcompat) )
+
         geoin2:hou.Geometry = nodeinputs[2].geometry()
         for var in variation_axes:
             # varcompat = ensure_compatible_name(var+'_real')
@@ -391,62 +402,133 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
     bezier_order = typecasterfont.bezier_order
     attrib_bezier_order = geo.addAttrib(hou.attribType.Global, "__bezier_order", 3, create_local_variable=False)
     geo.setGlobalAttribValue(attrib_bezier_order, bezier_order)
-    if bezier_order == 3:
-        HoudiniPen = HoudiniQuadraticPen( geo=geo, attrib_ctrlpts=attrib_ctrlpts)
-    elif bezier_order == 4:
-        HoudiniPen = HoudiniCubicPen( geo=geo, attrib_ctrlpts=attrib_ctrlpts)
-
-    # HoudiniPen.closefunc = increment_point_attribs
-
-    def newline(line_idx, stable_idx):
-        """Create a point and polygon for the next line with the relevant attributes"""
-        linept = geo.createPoint()
-        linept.setAttribValue( attrib_skeltype, "line" )
-        linept.setAttribValue( attrib_ids, [ line_idx, stable_idx] )
-        # linept = createPoint_delayedAttribs(skeltype='line', ids=[ line_idx, ])
-        grp_skel.add(linept)
-        blockpoly.addVertex(linept)
-        linepoly = geo.createPolygon(is_closed=False)
-        linepoly.addVertex(linept)
-        return linepoly
+    HoudiniPen = getHoudiniPen( bezier_order, geo=geo, attrib_ctrlpts=attrib_ctrlpts)
+
+    # Rather than creating each point and polygon while the text is processed, everything is recorded here in
+    # creation order and then written to Houdini by write_geometry. This allows all of the points to be created
+    # in a single call and the polygons in only a few, while keeping the same point and primitive order as
+    # creating them one at a time. Points are referenced by their index, and polygons are lists of those indices.
+    ptnum_start = geo.intrinsicValue("pointcount")
+    pt_skeltypes = []
+    pt_gshifts = []
+    pt_arrays = []
+    polys = []
+
+    # The helpers below run for every point, so the objects and methods they use are bound as default
+    # arguments. These are local lookups when called, rather than closure and attribute lookups.
+    def new_point( skeltype="", ids=None, gsz=None, gshift=(0.,0.), ctrlpts=None,
+                   _skeltypes_append=pt_skeltypes.append, _gshifts_extend=pt_gshifts.extend, _arrays=pt_arrays):
+        """Record a new point with the given attribute values, returning its index"""
+        _skeltypes_append(skeltype)
+        _gshifts_extend(gshift)
+        _arrays.append( (ids, gsz, ctrlpts) )
+        return len(_arrays)-1
+
+    def new_poly( is_closed, vertices, ids=None, _polys_append=polys.append):
+        """Record a new polygon from a list of point indices, returning the list so that more vertices can be added"""
+        _polys_append( (is_closed, vertices, ids) )
+        return vertices
+
+    def write_geometry():
+        """Create all of the recorded points and polygons in Houdini"""
+        pts = geo.createPoints( [(0.,0.,0.)]*len(pt_arrays) )
+
+        # The batched setters write every point, so any points that were already in the geometry need to keep their values
+        skeltype_values = list(geo.pointStringAttribValues("skeltype")[:ptnum_start]) if ptnum_start else []
+        skeltype_values.extend(pt_skeltypes)
+        geo.setPointStringAttribValues("skeltype", skeltype_values)
+        gshift_values = list(geo.pointFloatAttribValues("gshift")[:ptnum_start*2]) if ptnum_start else []
+        gshift_values.extend(pt_gshifts)
+        geo.setPointFloatAttribValues("gshift", gshift_values)
+
+        # HOM has no batched setters for array attributes, so those are still set per point
+        skel_pts = []
+        for pt, (ids, gsz, ctrlpts) in zip(pts, pt_arrays):
+            if ctrlpts is not None:
+                pt.setAttribValue( attrib_ctrlpts, ctrlpts)
+                continue
+            if ids is not None:
+                pt.setAttribValue( attrib_ids, ids)
+            if gsz is not None:
+                pt.setAttribValue( attrib_gsz, gsz)
+            skel_pts.append(pt)
+        grp_skel.add(skel_pts)
+
+        for (is_closed, has_vertices), group in itertools.groupby(polys, key=lambda poly: (poly[0], bool(poly[1]))):
+            group = list(group)
+            if has_vertices:
+                prims = geo.createPolygons( [ [ pts[idx] for idx in vertices ] for _, vertices, _ in group ], is_closed=is_closed)
+            else:
+                # Glyphs without any paths (like spaces) still need their polygon, which createPolygons can't create
+                prims = [ geo.createPolygon(is_closed=is_closed) for _ in group ]
+            for prim, (_, _, ids) in zip(prims, group):
+                if ids is not None:
+                    prim.setAttribValue( attrib_prim_ids, ids)
+
+    # Reshaping for per-glyph variation tends to repeat the exact same work, since neighbouring glyphs usually
+    # share both their text fragment and their variation values. The features are constant for the entire cook,
+    # so only the text and the variation values are needed to identify a result.
+    shape_cache = {}
+    advance_cache = {}
+    # Key for the variations currently applied to the font, so they are only set again when they actually change.
+    # Shaping applies its variations to the font as well, so this needs to be updated whenever the shaper runs.
+    applied_vars_key = None
+
+    def cached_shape( text, glyph_variations, vars_key):
+        """Shape the given text, reusing the result if the same text was already shaped with the same variations"""
+        nonlocal applied_vars_key
+        key = (text, vars_key)
+        shaped = shape_cache.get(key)
+        if shaped is None:
+            shaped = fontgoggle.shaper.shape( text, features=features, varLocation=glyph_variations, direction=None, language=None, script=None)
+            applied_vars_key = vars_key
+            shape_cache[key] = shaped
+        return shaped
+
+    def apply_variations( glyph_variations, vars_key):
+        """Set the variations of the font, unless they are already applied"""
+        nonlocal applied_vars_key
+        if vars_key != applied_vars_key:
+            hbfont.set_variations(glyph_variations)
+            applied_vars_key = vars_key
+
+    def cached_h_advance( gid, glyph_variations, vars_key):
+        """Get the advance of a glyph without kerning, reusing the result if it was already retrieved with the same variations"""
+        key = (gid, vars_key)
+        ax = advance_cache.get(key)
+        if ax is None:
+            apply_variations(glyph_variations, vars_key)
+            ax = hbfont.get_glyph_h_advance(gid)
+            advance_cache[key] = ax
+        return ax
+
+    def newline( line_idx, stable_idx, direction):
+        """Record a point and polygon for the next line with the relevant attributes"""
+        linept = new_point("line", ids=[ line_idx, stable_idx, direction])
+        blockpoly.append(linept)
+        return new_poly(False, [linept])
     
-    def new_glyphpt_skel( linepoly, gsz, ids, offset=None):
-        glyphpt_skel = geo.createPoint()
-        glyphpt_skel.setAttribValue( attrib_skeltype, "glyph" )
-        glyphpt_skel.setAttribValue( attrib_gsz, gsz )
-        glyphpt_skel.setAttribValue( attrib_ids, ids )
-        if offset is not None:
-            glyphpt_skel.setAttribValue( attrib_gshift, offset )
-        # glyphpt_skel = createPoint_delayedAttribs(skeltype='glyph', gsz=gsz, ids=ids)
-        grp_skel.add(glyphpt_skel)
-        linepoly.addVertex(glyphpt_skel)
+    def new_glyphpt_skel( linepoly, gsz, ids, offset=(0.,0.), queued=(), _new_point=new_point, _new_poly=new_poly):
+        """Record the skeleton point for a glyph, along with an extension connected to it for each queued (gsz, ids, offset)"""
+        glyphpt_skel = _new_point("glyph", ids, gsz, offset)
+        linepoly.append(glyphpt_skel)
+        for ext_gsz, ext_ids, ext_offset in queued:
+            _new_poly(False, [glyphpt_skel, _new_point("glyphextension", ext_ids, ext_gsz, ext_offset)])
         return glyphpt_skel
 
-    def new_glyphpt_skel_extension( gsz, ids, offset, target_glyphpt_skel):
-        glyphpt_skel_extension = geo.createPoint()
-        glyphpt_skel_extension.setAttribValue( attrib_skeltype, "glyphextension" )
-        glyphpt_skel_extension.setAttribValue( attrib_gsz, gsz )
-        glyphpt_skel_extension.setAttribValue( attrib_ids, ids )
-        glyphpt_skel_extension.setAttribValue( attrib_gshift, offset )
-        # glyphpt_skel_extension = createPoint_delayedAttribs(skeltype='glyphextension', gsz=gsz, ids=ids, gshift=offset)
-        grp_skel.add(glyphpt_skel_extension)
-        extensionpoly = geo.createPolygon(is_closed=False)
-        extensionpoly.addVertex(target_glyphpt_skel)
-        extensionpoly.addVertex(glyphpt_skel_extension)
-
     # Create the main point for the text block
-    blockpt = geo.createPoint()
-    blockpt.setAttribValue( attrib_skeltype, "block" )
-    # blockpt = createPoint_delayedAttribs(skeltype='block')
-    grp_skel.add(blockpt)
-    blockpoly = geo.createPolygon(is_closed=False)
-    blockpoly.addVertex(blockpt)
+    blockpt = new_point("block")
+    blockpoly = new_poly(False, [blockpt])
 
     stable_idx = 0
     true_idx = 0
     linestart = 0
     run_id_current = 0
     unique_glyphs = {}
+    # Key for the shared variations, used by every glyph unless it is varying per-glyph
+    base_vars_key = tuple(sorted(variations.items()))
+    # Whether the advance without kerning is included in gsz, which is only done for fonts using kerning that aren't varying per-glyph
+    emit_nokern = font_using_kern and not varying_per_glyph
 
     bidiparm:hou.Parm = interfacenode.parm('use_bidi_segmentation')
     use_bidi_segmentation = bidiparm.eval() if bidiparm else False
@@ -455,13 +537,35 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
     # No need to output the glyphs if the output style is frame prims
     outputstyleparm:hou.Parm = interfacenode.parm('output_style')
     output_glyphs = outputstyleparm.eval() != 3 if outputstyleparm else True
+    remove_overlaps = bool(interfacenode.evalParm('remove_glyph_overlaps'))
+    outline_cache = typecasterfont.outline_cache
+    glyphqueue = []
+    # The way outlines are drawn is chosen once here, rather than checking remove_overlaps for every glyph
+    if remove_overlaps:
+        # A single path and pen are rewound for each glyph, which keeps the path's storage instead of reallocating it
+        overlaps_path = PathopsPath()
+        overlaps_pen = overlaps_path.getPen()
+
+        def draw_outline( gid):
+            """Draw a glyph to the HoudiniPen, after removing its overlaps"""
+            overlaps_path.rewind()
+            hbfont.draw_glyph_with_pen(gid, overlaps_pen)
+            overlaps_path.simplify(fix_winding=True, keep_starting_points=True, clockwise=True)
+            HoudiniPen.output_from_pathops_path(overlaps_path)
+    else:
+        # The winding direction isn't fixed here. Fixing it with pathops roughly doubles the cost of outputting, and it would still
+        # miss glyphs where only some of the contours are wound the wrong way (like the dot of an exclamation point).
+        draw_outline = functools.partial(HoudiniPen.drawGlyph, hbfont)
+
+    def get_outlines( vars_key):
+        """Get the cached outlines for a set of variations, keyed by glyph id"""
+        return outline_cache.setdefault( (vars_key, remove_overlaps), {})
+    # Looked up once, since every glyph uses it unless it is varying per-glyph
+    base_outlines = get_outlines(base_vars_key)
 
     # Iterate through each line in the input string independently, to avoid any issues passing newlines to harfbuzz
     for line_id, line_text in enumerate(src_text.split("\n")):
 
-        # # Create the poly for the line about to be operated on
-        # linepoly = newline(line_id, stable_idx-1)
-
         line_created = 0
 
         # Process the input string
@@ -475,22 +579,26 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
         """
         glyph_runs = []
         line_dir = -1
-        if use_bidi_segmentation:
+        # Blank lines don't have any runs, so there's no need to segment or shape them
+        if line_text == "":
+            pass
+        elif use_bidi_segmentation:
             run_info = []
             reordered_segments, run_id_current, run_info, line_dir = line_to_run_segments(line_text, run_id_current, run_info)
             for segment in reordered_segments:
                 glyph_runs.append( (fontgoggle.shaper.shape( segment[0], features=features, varLocation=variations, direction=segment[1]), segment[0], segment[3]) )
         else:
-            if line_text != "":
-                glyph_runs.append( (fontgoggle.shaper.shape( line_text, features=features, varLocation=variations), line_text, 0) )
+            glyph_runs.append( (fontgoggle.shaper.shape( line_text, features=features, varLocation=variations), line_text, 0) )
+        if glyph_runs:
+            applied_vars_key = base_vars_key
 
-        glyphqueue = []
+        glyphqueue.clear()
         for current_runidx, (glyph_run, run_text, run_start) in enumerate(glyph_runs):
             # Detect if the current chunk is reversed
             # This seems like a pretty quick-and-dirty way to do it, but it works so far (famous last words)
-            is_reversed  = False
-            if glyph_run[-1].cluster < glyph_run[0].cluster:
-                is_reversed = True
+            clusters = [ g.cluster for g in glyph_run ]
+            glyph_count = len(clusters)
+            is_reversed = clusters[-1] < clusters[0]
 
             direction = __make_dir(is_reversed, line_dir)
             if current_runidx == 0:
@@ -505,31 +613,22 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
             line_idx = 0
             for glyph_idx, glyph in enumerate(glyph_run):
                 glyph_name = glyph.name
-                glyph_cluster_next = -1
-                glyph_cluster = glyph.cluster
+                glyph_cluster = clusters[glyph_idx]
+                glyph_cluster_next = clusters[glyph_idx+1] if glyph_idx+1 < glyph_count else -1
                 if is_reversed:
                     if glyph_idx > 0:
-                        try:
-                            glyph_cluster_next = glyph_run[ glyph_idx+1 ].cluster
-                        except IndexError:
-                            pass
-                        # glyph_cluster_prev = glyph_run[ glyph_idx-1 ].cluster
-                        # clustersize = glyph_cluster_prev - glyph_cluster
                         clustersize = glyph_cluster - glyph_cluster_next
                     else:
-                        glyph_cluster_next = glyph_run[ glyph_idx+1 ].cluster
                         clustersize = len(run_text) - glyph_cluster
+                elif glyph_cluster_next != -1:
+                    clustersize = glyph_cluster_next-glyph_cluster
                 else:
-                    try:
-                        glyph_cluster_next = glyph_run[ glyph_idx+1 ].cluster
-                        clustersize = glyph_cluster_next-glyph_cluster
-                    except IndexError:
-                        clustersize = len(run_text) - glyph_cluster
+                    clustersize = len(run_text) - glyph_cluster
 
                 # The is the main section to get all the needed information associated with the current glyph and operate on it.
                 glyph_already_exists = False
-                ax_nokern = None
                 glyph_variations = variations
+                vars_key = base_vars_key
                 unsafe_to_break = int(glyph.flags & GFLAG_UNSAFE_TO_BREAK == 1)
                 source_idx = run_start_full+glyph_cluster
                 glyph_class = typecasterfont.glyphClassDef.get(glyph_name,1)
@@ -540,21 +639,23 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
                     # need to be reshaped to get accurate positional information.
                     redo_for_mark_positioning = glyph_class == 3 and (glyph.dx != 0 or glyph.dy != 0)
                     
-                    # Set the per-glyph variations
-                    glyph_variations = variations.copy()
-                    try:
-                        for var in variation_axes:
-                            varcompat = ensure_compatible_name(var)
-                            if varcompat in attribstatus:
-                                glyph_variations[var] = hpoints[stable_idx].attribValue(varcompat)
-                    except IndexError:
-                        pass
+                    # Set the per-glyph variations, only copying the shared variations if this glyph actually differs from them
+                    if stable_idx < len(hpoints):
+                        hpoint = hpoints[stable_idx]
+                        for var, varcompat in active_axes:
+                            value = hpoint.attribValue(varcompat)
+                            if value != glyph_variations.get(var):
+                                if glyph_variations is variations:
+                                    glyph_variations = variations.copy()
+                                glyph_variations[var] = value
+                    if glyph_variations is not variations:
+                        vars_key = tuple(sorted(glyph_variations.items()))
                     
                     needs_run = True
                     # Below is an extremely experimental system to reprocess a given tex run for glyph variations. This doesn't catch if the number of glyphs changes though.
                     if reprocess_for_glyphswap:
                         try:
-                            glyph = fontgoggle.shaper.shape( run_text, features=features, varLocation=glyph_variations, direction=None, language=None, script=None)[glyph_cluster]
+                            glyph = cached_shape( run_text, glyph_variations, vars_key)[glyph_cluster]
                             ax = glyph.ax
                             needs_run = False
                         except IndexError:
@@ -573,28 +674,25 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
                         Additionally, if it were possible to obtain a list of existing kern pairs in the font this could also be used to accelerate everything.
                         """
                         if reshape_entire_run_for_varying or redo_for_mark_positioning:
-                            reglyph = fontgoggle.shaper.shape( run_text, features=features, varLocation=glyph_variations, direction=None, language=None, script=None)[glyph_idx]
+                            reglyph = cached_shape( run_text, glyph_variations, vars_key)[glyph_idx]
                         else:
                             minimal_text_approx = src_text_stripped[source_idx:source_idx+clustersize+1]
-                            reglyph = fontgoggle.shaper.shape( minimal_text_approx, features=features, varLocation=glyph_variations, direction=None, language=None, script=None)[0]
+                            reglyph = cached_shape( minimal_text_approx, glyph_variations, vars_key)[0]
 
                         # Check if the glyph created from the subset of the current line actually is the same as what harfbuzz did for the full line. This should avoid incorrect glyphs being used for complex clusters.
                         if reglyph.name == glyph.name:
-                        # if True and not is_reversed:
                             ax = reglyph.ax
                             glyph = reglyph
                         else:
                             # fallback to glyph's default advance without kerning
-                            ax = fontgoggle.shaper.font.get_glyph_h_advance(glyph.gid)
+                            ax = cached_h_advance( glyph.gid, glyph_variations, vars_key)
                     else:
                         # Update advance size given the current variable font axes
-                        fontgoggle.shaper.font.set_variations(glyph_variations)
-                        ax = fontgoggle.shaper.font.get_glyph_h_advance(glyph.gid)
+                        ax = cached_h_advance( glyph.gid, glyph_variations, vars_key)
                 else:
-                    # ax = fontgoggle.shaper.font.get_glyph_h_advance(glyph.gid)
                     ax = glyph.ax
-                    if font_using_kern:
-                        ax_nokern = fontgoggle.shaper.font.get_glyph_h_advance(glyph.gid)
+                    if emit_nokern:
+                        ax_nokern = cached_h_advance( glyph.gid, variations, base_vars_key)
 
                 # Set all of the different ids for each glyph.
                 # This is essentially every possible identifier that might be used to segment or identify a given input string.
@@ -635,8 +733,7 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
                     consult __make_dir for an explanation of possible values
                 """
                 codepoint_lazy = ord(run_text[glyph_cluster])
-                dictstring = f"glyph{glyph.gid}"+str(sorted(glyph_variations.items()))
-                glyph_hash = hash(dictstring)
+                glyph_hash = hash( (glyph.gid, vars_key) )
                 run_id = run_info[current_runidx][0] if use_bidi_segmentation else line_id
                 ids = [
                     line_id,
@@ -663,19 +760,21 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
                 # this is mainly found in CJK and similar language fonts.
 
                 if vmtx:
-                    gsz = [float(ax), float(vmtx.metrics.get(glyph_name,0)[0])]
-                    if gsz[1] == 0:
-                        gsz[1] = float(general_glyph_height)
+                    glyph_height = vmtx_heights.get(glyph.gid)
+                    if glyph_height is None:
+                        metric = vmtx.metrics.get(glyph_name)
+                        glyph_height = float(metric[0]) if metric and metric[0] else general_glyph_height
+                        vmtx_heights[glyph.gid] = glyph_height
                 else:
-                    gsz = [float(ax), float(general_glyph_height)]
+                    glyph_height = general_glyph_height
 
-                # This condition is now caught in the vmtx condition above by falling back to the general glyph height value. This might cause issues with vertical scripts.
-                # if gsz[1] == 0:
-                #     print(f"---------- NOT SUPPOSED TO HAPPEN: The current glyph's height is 0 ({glyph_name} with ({gsz}))--------------")
+                # A glyph height of 0 is caught in the vmtx condition above by falling back to the general glyph height value. This might cause issues with vertical scripts.
 
                 # For use with pivot adjustment, this appends a "standard" version of the glyph's size (width) that doesn't use kern pairs.
-                if font_using_kern and ax_nokern is not None:
-                    gsz.extend( [ ax_nokern, gsz[1] ] )
+                if emit_nokern:
+                    gsz = (float(ax), glyph_height, ax_nokern, glyph_height)
+                else:
+                    gsz = (float(ax), glyph_height)
 
                 run_standard_glyph = True
                 offset = (float(glyph.dx),float(glyph.dy))
@@ -695,68 +794,39 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
                         Using glyphqueue generally works pretty well but in some cases I feel like the secondary marks
                         bind to the incorrect main glyph. That said this isn't consistent so it's likely a quirk of Playwrite
                         """
-                        # msg = f"Unusual case for zero-length cluster staging. If you see this message and aren't the author, if possible please submit the font you were using which caused this so I can expand the functionality."
-                        # msg += f"\n(gname:{glyph_name}, gid:{ids[3]}, run_txt:{run_text}, glyph_idx:{glyph_idx}), gsz:{gsz}"
-                        # raise NotImplementedError(msg)
-                        # print(msg)
                         if gsz[0] == 0:
                             run_standard_glyph = False
                             glyphqueue.append( ( gsz, ids, offset) )
-                        # new_glyphpt_skel( linepoly, gsz, ids)
-                        # new_glyphpt_skel_extension( gsz=gsz, ids=ids, offset=offset, target_glyphpt_skel=glyphpt_skel)
 
                 if run_standard_glyph:
-                    if offset[0] != 0.0 or offset[1] != 0.0:
-                        glyphpt_skel = new_glyphpt_skel( linepoly, gsz, ids, offset)
-                    else:
-                        glyphpt_skel = new_glyphpt_skel( linepoly, gsz, ids)
-            
+                    # The glyphqueue is used to place markings AFTER their main glyph even when the markings show up first in the glyph
+                    # run. This doesn't have any effect on the various idx values since they are conserved, but it allows for a
+                    # more correct rig heirarchy.
+                    new_glyphpt_skel( linepoly, gsz, ids, offset, glyphqueue)
                     if glyphqueue:
-                        # The glyphqueue is used to place markings AFTER their main glyph even when the markings show up first in the glyph
-                        # run. This doesn't have any effect on the various idx values since they are conserved, but it allows for a
-                        # more correct rig heirarchy.
-                        for (lastdata) in glyphqueue:
-                            has_glyphextension = True
-                            new_glyphpt_skel_extension( gsz=lastdata[0], ids=lastdata[1], offset=lastdata[2], target_glyphpt_skel=glyphpt_skel)
-                        glyphqueue = []
+                        has_glyphextension = True
+                        glyphqueue.clear()
 
                 if output_glyphs and not glyph_already_exists:
-                    # Create the polygon for the current glyph, which will contain the construction points needed for the individual bezier paths
-                    glyphpoly = geo.createPolygon(is_closed=True)
-                    glyphpoly.setAttribValue( attrib_prim_ids, ids )
-
-                    HoudiniPen.polygon = glyphpoly
-
-                    remove_overlaps = interfacenode.evalParm('remove_glyph_overlaps')
-                    if remove_overlaps:
-                        p1 = PathopsPath()
-                        
-                        # gset = glyphSet[glyph.name]
-                        # gset.draw(p1.getPen(glyphSet=glyphSet))
-                        fontgoggle.shaper.font.draw_glyph_with_pen(glyph.gid, p1.getPen())
-
-                        p1.simplify(fix_winding=True, keep_starting_points=True, clockwise=True)
-                        HoudiniPen.output_from_pathops_path(p1)                
-                    else:
-
-                        # outline = fontgoggle._getGlyphOutline(glyph_name)
-                        # for mv, pts in outline.value:
-                            # getattr(HoudiniPen, mv)(*pts)
-                        
-                        fontgoggle.shaper.font.draw_glyph_with_pen(glyph.gid, HoudiniPen )
-                        
-                        # The following fixes the winding direction, but roughly doubles the cost of outputting,
-                        # since it has to create each path as a pathops pen, and then a Houdini pen
-                        # this is also a large factor in why remove_overlaps costs more, in addition to the additional
-                        # calculations
-                        # also, this doesn't really catch everything since it operates over the entire glyph and not subcomponents
-                        # So for an exclamation point the dot could have the correct winding dirrection but the line could be wrong
-
-                        # p1 = PathopsPath()
-                        # fontgoggle.shaper.font.draw_glyph_with_pen(glyph.gid, p1.getPen() )
-                        # if not p1.clockwise:
-                        #     p1.reverse()
-                        # HoudiniPen.output_from_pathops_path(p1) 
+                    # The outline of a glyph only depends on its variations and whether overlaps are removed, so the
+                    # paths drawn for it are kept on the font and reused by later cooks.
+                    outlines = base_outlines if vars_key is base_vars_key else get_outlines(vars_key)
+                    paths = outlines.get(glyph.gid)
+                    if paths is None:
+                        # The font's variations may have been left at another glyph's location by the cached reshapes
+                        apply_variations(glyph_variations, vars_key)
+                        draw_outline(glyph.gid)
+                        paths = HoudiniPen.popPaths()
+                        if typecasterfont.outline_count >= tcf.OUTLINE_CACHE_SIZE:
+                            outline_cache.clear()
+                            typecasterfont.outline_count = 0
+                            base_outlines = get_outlines(base_vars_key)
+                            outlines = get_outlines(vars_key)
+                        outlines[glyph.gid] = paths
+                        typecasterfont.outline_count += 1
+
+                    # Create the polygon for the current glyph, which contains the construction points needed for the individual bezier paths
+                    new_poly(True, [ new_point(ctrlpts=ptsset) for ptsset in paths ], ids)
 
                 # Increment stable_idx by the size of the current_glyph's cluster, in addition to the line index, which resets for each line
                 stable_idx += clustersize
@@ -775,11 +845,9 @@ def output_geo_fast( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry
         # For each new line, increment stable_idx by 1
         stable_idx += 1
     
+    write_geometry()
     geo.setGlobalAttribValue(attrib_stable_idx_max, stable_idx-2)
     geo.setGlobalAttribValue(attrib_has_glyphextension, has_glyphextension)
-    # profiler.disable()
-    # import pstats
-    # pstats.Stats(profiler).sort_stats('ncalls').print_stats()
 
 
 def get_glyph_points( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometry, core_node:hou.OpNode):
@@ -804,27 +872,8 @@ def get_glyph_points( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometr
     # Maximum value for stable_idx, accounting for cluster size
     attrib_stable_idx_max = geo.addAttrib(hou.attribType.Global, "stable_idx_max", 0, create_local_variable=False)
 
-    # Find all the feature folders and get the value of the parameters within
-    ptg = interfacenode.parmTemplateGroup()
-    featfolder_name = "general_features"
-    ssfolder_name = "stylistic_sets"
-    cvfolder_name = "character_variants"
-
-    targetfolder = ptg.find(featfolder_name)
-    if not targetfolder:
-        targetfolder = ptg.find(featfolder_name+'2')
-    features = { parm.name() : interfacenode.parm(parm.name()).evalAsInt() for parm in targetfolder.parmTemplates() }
-
-    targetfolder = ptg.find(ssfolder_name)
-    if not targetfolder:
-        targetfolder = ptg.find(ssfolder_name+'2')
-    features.update({ parm.name() : interfacenode.parm(parm.name()).evalAsInt() for parm in targetfolder.parmTemplates() })
-
-    targetfolder = ptg.find(cvfolder_name)
-    if not targetfolder:
-        targetfolder = ptg.find(cvfolder_name+'2')
-    features.update({ parm.name() : interfacenode.parm(parm.name()).evalAsInt() for parm in targetfolder.parmTemplates() })
-
+    # Get the value of all of the feature parameters
+    features = { name : interfacenode.evalParm(name) for name in __get_feature_parm_names(interfacenode) }
 
     # If the necessary inputs are used, configure for per-glyph variation
     variations = {}
@@ -853,47 +902,40 @@ def get_glyph_points( interfacenode:hou.OpNode, node:hou.OpNode, geo:hou.Geometr
     for line_id, line_text in enumerate(src_text.split("\n")):
         glyph_runs = []
         line_dir = -1
-        if use_bidi_segmentation:
+        # Blank lines don't have any runs, so there's no need to segment or shape them
+        if line_text == "":
+            pass
+        elif use_bidi_segmentation:
             run_info = []
             reordered_segments, run_id_current, run_info, line_dir = line_to_run_segments(line_text, run_id_current, run_info)
             for segment in reordered_segments:
                 glyph_runs.append( (fontgoggle.shaper.shape( segment[0], features=features, varLocation=variations, direction=segment[1]), segment[0], segment[3]) )
         else:
-            if line_text != "":
-                glyph_runs.append( (fontgoggle.shaper.shape( line_text, features=features, varLocation=variations), line_text, 0) )
+            glyph_runs.append( (fontgoggle.shaper.shape( line_text, features=features, varLocation=variations), line_text, 0) )
 
         for current_runidx, (glyph_run, run_text, run_start) in enumerate(glyph_runs):
             # Detect if the current chunk is reversed
             # This seems like a pretty quick-and-dirty way to do it, but it works so far (famous last words)
-            is_reversed  = False
-            if glyph_run[-1].cluster < glyph_run[0].cluster:
-                is_reversed = True
+            clusters = [ g.cluster for g in glyph_run ]
+            glyph_count = len(clusters)
+            is_reversed = clusters[-1] < clusters[0]
 
             # The is the start index of the current text run, accounting for previous line's runs
             run_start_full = linestart+run_start
 
             line_idx = 0
             for glyph_idx, glyph in enumerate(glyph_run):
-                glyph_cluster_next = -1
-                glyph_cluster = glyph.cluster
+                glyph_cluster = clusters[glyph_idx]
+                glyph_cluster_next = clusters[glyph_idx+1] if glyph_idx+1 < glyph_count else -1
                 if is_reversed:
                     if glyph_idx > 0:
-                        try:
-                            glyph_cluster_next = glyph_run[ glyph_idx+1 ].cluster
-                        except IndexError:
-                            pass
-                        # glyph_cluster_prev = glyph_run[ glyph_idx-1 ].cluster
-                        # clustersize = glyph_cluster_prev - glyph_cluster
                         clustersize = glyph_cluster - glyph_cluster_next
                     else:
-                        glyph_cluster_next = glyph_run[ glyph_idx+1 ].cluster
                         clustersize = len(run_text) - glyph_cluster
+                elif glyph_cluster_next != -1:
+                    clustersize = glyph_cluster_next-glyph_cluster
                 else:
-                    try:
-                        glyph_cluster_next = glyph_run[ glyph_idx+1 ].cluster
-                        clustersize = glyph_cluster_next-glyph_cluster
-                    except IndexError:
-                        clustersize = len(run_text) - glyph_cluster
+                    clustersize = len(run_text) - glyph_cluster
 
                 # Set all of the different ids for each glyph.
                 # This is essentially every possible identifier that might be used to segment or identify a given input string.